@@ -1,17 +1,183 @@
 
+import argparse
+import gc
+import hashlib
 import math
+import os
+import pickle
+import queue
 import random
+import struct
+import threading
+import time
+import traceback
 import turtle
+import weakref
+
+class Wait:
+    def __init__(self, frames):
+        self.frames = frames
+
+    def __iter__(self):
+        for i in range(0, self.frames):
+            yield
 
 def wait_for_seconds(t):
-    for i in range(0, int(t*16)):
-        yield
+    return Wait(int(t*16))
 
 def start_coroutine(coroutine):
+    coroutine_source(coroutine)
     coroutines.append(coroutine)
+    resource_tracker.allocate(coroutine, "Coroutine")
 
 def stop_coroutine(coroutine):
     coroutines.remove(coroutine)
+    resource_tracker.release(coroutine)
+
+def coroutine_source(coroutine):
+    # coroutines are restarted from their owner on restore, so they must keep their progress on it
+    frame = getattr(coroutine, "gi_frame", None)
+    owner = frame.f_locals.get("self") if frame is not None else None
+    method = getattr(owner, coroutine.__name__, None) if owner is not None else None
+    if method is None or getattr(method, "__code__", None) is not coroutine.gi_code:
+        raise TypeError("coroutines must be generator methods called on their owner, got " + repr(coroutine))
+    return owner, coroutine.__name__
+
+class ResourceLeakError(RuntimeError):
+    pass
+
+class ResourceTracker:
+    def __init__(self, enabled = False, tolerance = 0):
+        self.enabled = enabled
+        self.tolerance = tolerance
+        # weakref callbacks can fire from a collection started while the lock is held
+        self.lock = threading.RLock()
+        self.live = {}
+        self.released = {}
+        self.limits = {}
+        self.stage = None
+        self.stage_counts = None
+
+    def allocate(self, obj, kind, transient = False, site = None):
+        if not self.enabled:
+            return
+        if site is None:
+            caller = traceback.extract_stack(limit=3)[0]
+            site = caller.name + ":" + str(caller.lineno)
+        key = id(obj)
+        ref = weakref.ref(obj, lambda ref: self.forget(key, ref))
+        with self.lock:
+            self.released.pop(key, None)
+            self.live[key] = (ref, kind, site, transient)
+
+    def forget(self, key, ref):
+        with self.lock:
+            if key in self.live and self.live[key][0] is ref:
+                del self.live[key]
+            if key in self.released and self.released[key][0] is ref:
+                del self.released[key]
+
+    def release(self, obj):
+        if not self.enabled:
+            return
+        with self.lock:
+            record = self.live.pop(id(obj), None)
+            if record is not None:
+                self.released[id(obj)] = record
+
+    def release_kinds(self, kinds):
+        if not self.enabled:
+            return
+        with self.lock:
+            for key, record in list(self.live.items()):
+                if record[1] in kinds:
+                    del self.live[key]
+                    self.released[key] = record
+
+    def reset_stages(self):
+        # a restored world starts its stages over, so earlier counts and released objects no longer apply
+        with self.lock:
+            self.released.clear()
+        self.stage = None
+        self.stage_counts = None
+
+    def set_limit(self, kind, limit, lock):
+        # kinds that are pooled are held to a bound instead of compared between stages
+        self.limits[kind] = (limit, lock)
+
+    def records(self, released = False):
+        with self.lock:
+            records = list((self.released if released else self.live).values())
+        return [(ref(), kind, site, transient) for ref, kind, site, transient in records if ref() is not None]
+
+    def counts(self, persistent_only = False):
+        counts = {}
+        for obj, kind, site, transient in self.records():
+            if persistent_only and (transient or getattr(obj, "transient", False)):
+                continue
+            counts[kind] = counts.get(kind, 0) + 1
+        return counts
+
+    def retained(self):
+        # released objects still reachable after a collection are held by something that outlived them,
+        # apart from those the stage scripts keep by name
+        gc.collect()
+        named = set()
+        for value in list(globals().values()):
+            named.add(id(value))
+            named.add(id(getattr(value, "game_object", None)))
+        return [record for record in self.records(released=True) if id(record[0]) not in named]
+
+    def retained_counts(self):
+        counts = {}
+        for obj, kind, site, transient in self.retained():
+            counts[kind] = counts.get(kind, 0) + 1
+        return counts
+
+    def site_counts(self, records):
+        counts = {}
+        for obj, kind, site, transient in records:
+            counts[(kind, site)] = counts.get((kind, site), 0) + 1
+        return counts
+
+    def report(self):
+        lines = ["live resources:"]
+        for kind, count in sorted(self.counts().items()):
+            lines.append("  " + kind + ": " + str(count))
+        lines.append("by creation site:")
+        for (kind, site), count in sorted(self.site_counts(self.records()).items(), key=lambda item: -item[1]):
+            lines.append("  " + kind + " @ " + site + ": " + str(count))
+        retained = self.site_counts(self.retained())
+        if retained:
+            lines.append("released but still referenced:")
+            for (kind, site), count in sorted(retained.items(), key=lambda item: -item[1]):
+                lines.append("  " + kind + " @ " + site + ": " + str(count))
+        return "\n".join(lines)
+
+    def check_stage(self, stage):
+        # transient objects (bullets, effects, timers) come and go, everything else must not pile up between stages
+        if not self.enabled or stage == self.stage:
+            return
+        problems = []
+        counts = self.counts(persistent_only=True)
+        for kind, (limit, lock) in self.limits.items():
+            with lock:
+                count = self.counts().get(kind, 0)
+                bound = limit()
+            if count > bound:
+                problems.append(kind + " " + str(count) + " over limit " + str(bound))
+            counts.pop(kind, None)
+        for kind, count in self.retained_counts().items():
+            counts[kind + " released"] = count
+        if self.stage_counts is not None:
+            for kind, count in counts.items():
+                growth = count - self.stage_counts.get(kind, 0)
+                if growth > self.tolerance:
+                    problems.append(kind + " +" + str(growth))
+        if problems:
+            raise ResourceLeakError("resources leaked between stage " + str(self.stage) + " and " + str(stage) + ": " + ", ".join(problems) + "\n" + self.report())
+        self.stage = stage
+        self.stage_counts = counts
 
 class Component:
     def __init__(self):
@@ -23,6 +189,43 @@ class Component:
     def start(self):
         pass
 
+    def wants_update(self):
+        return type(self).update is not Component.update
+
+def index_component(comp):
+    system = type(comp)
+    if system not in system_order:
+        system_order.append(system)
+    components = component_index.setdefault(system, [])
+    comp.system_slot = len(components)
+    components.append(comp)
+
+def unindex_component(comp):
+    slot = getattr(comp, "system_slot", None)
+    if slot is None:
+        return
+    components = component_index[type(comp)]
+    last = components.pop()
+    if last is not comp:
+        components[slot] = last
+        last.system_slot = slot
+    comp.system_slot = None
+
+def set_system_order(order):
+    system_order[:] = order
+
+def run_systems():
+    for system in system_order[:]:
+        components = component_index.get(system)
+        if not components:
+            continue
+        started = time.perf_counter()
+        for comp in components[:]:
+            if comp.game_object is not None and not comp.game_object.destroyed:
+                comp.update()
+        if profile_systems:
+            system_timings[system] = system_timings.get(system, 0) + time.perf_counter() - started
+
 class Vector2:
     def __init__(self, x = 0, y = 0):
         self.x = x
@@ -65,21 +268,14 @@ class Transform(Component):
         super().__init__()
         self._parent = None
         self.children = []
-        self.position = Vector2()
-        self.rotation = 0
-        self.scale = Vector2(1, 1)
-        self.local_position = None
-        self.local_scale = None
-        self.local_rotation = None
+        self._position = Vector2()
+        self._rotation = 0
+        self._scale = Vector2(1, 1)
+        self._local_position = None
+        self._local_scale = None
+        self._local_rotation = None
         self.ignore_parent_scale = False
-
-    def update(self):
-        if self.parent is not None:
-            self.position = self.parent.position + self.local_position
-            self.rotation = self.parent.rotation + self.local_rotation
-            if not self.ignore_parent_scale:
-                self.scale = self.parent.scale * self.local_scale
-            self.rotation = self.parent.rotation + self.local_rotation
+        self.dirty = False
 
     def tween_position(self, new_position, speed):
         return Lerp(self, "position", new_position, speed)
@@ -90,6 +286,80 @@ class Transform(Component):
     def tween_scale(self, new_scale, speed):
         return Lerp(self, "scale", new_scale, speed)
 
+    # values are replaced, never mutated in place, so every change goes through a setter and marks the hierarchy dirty
+    @property
+    def position(self):
+        return self._position
+
+    @position.setter
+    def position(self, val):
+        self._position = val
+        if self.children:
+            self.mark_dirty()
+
+    @property
+    def rotation(self):
+        return self._rotation
+
+    @rotation.setter
+    def rotation(self, val):
+        self._rotation = val
+        if self.children:
+            self.mark_dirty()
+
+    @property
+    def scale(self):
+        return self._scale
+
+    @scale.setter
+    def scale(self, val):
+        self._scale = val
+        if self.children:
+            self.mark_dirty()
+
+    @property
+    def local_position(self):
+        return self._local_position
+
+    @local_position.setter
+    def local_position(self, val):
+        self._local_position = val
+        self.mark_dirty()
+
+    @property
+    def local_rotation(self):
+        return self._local_rotation
+
+    @local_rotation.setter
+    def local_rotation(self, val):
+        self._local_rotation = val
+        self.mark_dirty()
+
+    @property
+    def local_scale(self):
+        return self._local_scale
+
+    @local_scale.setter
+    def local_scale(self, val):
+        self._local_scale = val
+        self.mark_dirty()
+
+    def mark_dirty(self):
+        if not self.dirty:
+            self.dirty = True
+            dirty_transforms.append(self)
+
+    def resolve(self):
+        parent = self._parent
+        if parent is not None:
+            self._position = parent._position + self._local_position
+            self._rotation = parent._rotation + self._local_rotation
+            if not self.ignore_parent_scale:
+                self._scale = parent._scale * self._local_scale
+        self.dirty = False
+        for child in self.children:
+            child.resolve()
+
     @property
     def parent(self):
         return self._parent
@@ -111,20 +381,38 @@ class Transform(Component):
         self.on_unparent()
 
     def on_parent(self):
-        self.local_position = self.position
-        self.local_scale = self.scale
-        self.local_rotation = self.rotation
+        self._local_position = self._position
+        self._local_scale = self._scale
+        self._local_rotation = self._rotation
+        self.mark_dirty()
 
     def on_unparent(self):
-        self.local_position = None
-        self.local_scale = None
-        self.local_rotation = None
+        self._local_position = None
+        self._local_scale = None
+        self._local_rotation = None
+
+def resolve_transforms():
+    # resolve from the highest dirty ancestor so parents always settle before their children
+    for transform in dirty_transforms:
+        if not transform.dirty:
+            continue
+        root = transform
+        node = transform.parent
+        while node is not None:
+            if node.dirty:
+                root = node
+            node = node.parent
+        root.resolve()
+    dirty_transforms.clear()
 
 class GameObject(Component):
     def __init__(self, position: Vector2 = None, scale: Vector2 = None, starting_comps = None):
         super().__init__()
         self.game_object = self
         self.components = []
+        self.timers = []
+        self.transient = False
+        self.destroyed = False
 
         if position is None:
             position = Vector2()
@@ -137,46 +425,91 @@ class GameObject(Component):
         self.transform.position = position
         self.transform.scale = scale
         game_objects.append(self)
+        resource_tracker.allocate(self, "GameObject")
 
         for comp in starting_comps:
             self.add_component(comp)
 
     def destroy(self):
-        if not (self in game_objects):
+        if self.destroyed:
             return
+        self.destroyed = True
         game_objects.remove(self)
+        resource_tracker.release(self)
         for comp in self.components:
+            unindex_component(comp)
             if isinstance(comp, RenderObject):
-                comp.pen.clear()
                 render_objects.remove(comp)
             if isinstance(comp, Bullet):
                 bullets.remove(comp)
-        for child in self.transform.children:
+            if isinstance(comp, Enemy):
+                enemies.remove(comp)
+        for timer in self.timers[:]:
+            timer.cancel()
+        for lerp in lerps[:]:
+            if getattr(lerp.obj, "game_object", None) is self:
+                lerp.cancel()
+        for child in self.transform.children[:]:
             child.game_object.destroy()
+        if self.transform.parent is not None:
+            del self.transform.parent
 
     def add_component(self, comp):
         self.components.append(comp)
         comp.game_object = self
+        if comp.wants_update():
+            index_component(comp)
         comp.start()
         return comp
 
     def remove_component(self, comp):
         self.components.remove(comp)
-
-    def update(self):
-        for comp in self.components:
-            comp.update()
-
+        unindex_component(comp)
+        comp.game_object = None
+
+
+def acquire_pen():
+    if pen_pool:
+        return pen_pool.pop()
+    pen = turtle.Turtle()
+    pen.hideturtle()
+    pen.penup()
+    pen.speed(0)
+    resource_tracker.allocate(pen, "Pen")
+    return pen
+
+def release_pen(pen):
+    pen.clear()
+    if len(pen_pool) < pen_pool_limit:
+        pen_pool.append(pen)
+        return True
+    dispose_pen(pen)
+    return False
+
+def dispose_pen(pen):
+    # a cleared turtle still owns its line and shape items and stays in the screen's turtle list
+    pen.clear()
+    screen._delete(pen.currentLineItem)
+    items = pen.turtle._item
+    if not isinstance(items, list):
+        items = [items]
+    for item in items:
+        screen._delete(item)
+    screen._turtles.remove(pen)
+    resource_tracker.release(pen)
+
+def new_render_id():
+    global next_render_id
+    next_render_id += 1
+    return next_render_id
 
 class RenderObject(Component):
     def __init__(self):
         super().__init__()
-        self.pen = turtle.Turtle()
-        self.pen.hideturtle()
-        self.pen.penup()
-        self.pen.speed(0)
+        self.render_id = new_render_id()
         self.sort_order = 0
         self.visible = True
+        self.cullable = True
         render_objects.append(self)
 
     def toggle_visibility(self):
@@ -185,16 +518,8 @@ class RenderObject(Component):
         else:
             self.visible = True
 
-    def render(self):
-        self.pen.clear()
-        if self.visible:
-            self.pen.shapesize(stretch_len=self.game_object.transform.scale.x, stretch_wid=self.game_object.transform.scale.y)
-            self.pen.setheading(self.game_object.transform.rotation)
-            self.pen.goto(self.game_object.transform.position.x, self.game_object.transform.position.y)
-            self.pseudostamp()
-
-    def pseudostamp(self):
-        pass
+    def render_state(self):
+        return None, None, None
 
 class Sprite(RenderObject):
     def __init__(self, color = "white", shape = "square"):
@@ -202,11 +527,8 @@ class Sprite(RenderObject):
         self.color = color
         self.shape = shape
 
-    def pseudostamp(self):
-        super().pseudostamp()
-        self.pen.shape(self.shape)
-        self.pen.color(self.color)
-        self.pen.stamp()
+    def render_state(self):
+        return self.shape, self.color, None
 
 class Text(RenderObject):
     def __init__(self, text = " ", color = "black", font_size = "54", font = "arial", align = "center"):
@@ -216,30 +538,314 @@ class Text(RenderObject):
         self.font_size = font_size
         self.align = align
         super().__init__()
+        self.cullable = False
+
+    def render_state(self):
+        return None, self.color, (self.text, (self.font, self.font_size), self.align)
+
+class RenderSnapshot:
+    def __init__(self, time, cut = False):
+        self.time = time
+        self.published_at = None
+        self.background_time = 0
+        self.cut = cut
+        self.ids = []
+        self.xs = []
+        self.ys = []
+        self.rotations = []
+        self.scale_xs = []
+        self.scale_ys = []
+        self.shapes = []
+        self.colors = []
+        self.sort_orders = []
+        self.cullables = []
+        self.texts = []
+
+    @staticmethod
+    def capture(time, cut = False):
+        snapshot = RenderSnapshot(time, cut)
+        ros = render_objects
+        ros.sort(key=lambda r: r.sort_order)
+        for r in ros:
+            if not r.visible:
+                continue
+            transform = r.game_object.transform
+            shape, color, text = r.render_state()
+            snapshot.ids.append(r.render_id)
+            snapshot.xs.append(transform.position.x)
+            snapshot.ys.append(transform.position.y)
+            snapshot.rotations.append(transform.rotation)
+            snapshot.scale_xs.append(transform.scale.x)
+            snapshot.scale_ys.append(transform.scale.y)
+            snapshot.shapes.append(shape)
+            snapshot.colors.append(color)
+            snapshot.sort_orders.append(r.sort_order)
+            snapshot.cullables.append(r.cullable)
+            snapshot.texts.append(text)
+        snapshot.background_time = background.scroll_time
+        snapshot.freeze()
+        return snapshot
+
+    def freeze(self):
+        for name in ["ids", "xs", "ys", "rotations", "scale_xs", "scale_ys", "shapes", "colors", "sort_orders", "cullables", "texts"]:
+            setattr(self, name, tuple(getattr(self, name)))
+        self.published_at = time.perf_counter()
+
+class SnapshotBuffer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.previous = None
+        self.latest = None
+
+    def publish(self, snapshot):
+        with self.lock:
+            self.previous = self.latest
+            self.latest = snapshot
+
+    def read(self):
+        with self.lock:
+            return self.previous, self.latest
+
+class PenState:
+    def __init__(self, pen):
+        self.pen = pen
+        self.shape = None
+        self.color = None
+        self.stretch = None
+        self.heading = None
+
+    def set_shape(self, shape):
+        if shape != self.shape:
+            self.pen.shape(shape)
+            self.shape = shape
+
+    def set_color(self, color):
+        if color != self.color:
+            self.pen.color(color)
+            self.color = color
+
+    def set_stretch(self, stretch):
+        if stretch != self.stretch:
+            self.pen.shapesize(stretch_len=stretch[0], stretch_wid=stretch[1])
+            self.stretch = stretch
+
+    def set_heading(self, heading):
+        if heading != self.heading:
+            self.pen.setheading(heading)
+            self.heading = heading
+
+class BackgroundTiles:
+    def __init__(self, canvas, layer):
+        self.canvas = canvas
+        self.layer = layer
+        photo = screen._shapes[layer.image]._data
+        self.height = photo.height()
+        # centre of the first tile when its bottom edge sits on the bottom of the arena
+        self.bottom = -game_dimensions.y / 2 + self.height / 2
+        count = int(math.ceil(game_dimensions.y / self.height)) + 1
+        self.ys = [self.bottom + i * self.height for i in range(0, count)]
+        self.items = [canvas.create_image(layer.x * screen.xscale, -y * screen.yscale, image=photo) for y in self.ys]
+
+    def scroll(self, scroll_time):
+        # tiles leaving the bottom wrap to the top as the offset wraps around the tile height
+        offset = (self.layer.scroll_rate * scroll_time) % self.height
+        for i in range(0, len(self.items)):
+            y = self.bottom + i * self.height - offset
+            if y != self.ys[i]:
+                self.canvas.move(self.items[i], 0, -(y - self.ys[i]) * screen.yscale)
+                self.ys[i] = y
+
+class BackgroundRenderer:
+    def __init__(self, layers):
+        canvas = screen.getcanvas()
+        self.tiles = [BackgroundTiles(canvas, layer) for layer in layers]
+        self.scroll_time = None
+
+    def render(self, scroll_time):
+        if scroll_time == self.scroll_time:
+            return
+        self.scroll_time = scroll_time
+        for tiles in self.tiles:
+            tiles.scroll(scroll_time)
+
+class Renderer:
+    def __init__(self, snapshot_buffer):
+        self.snapshot_buffer = snapshot_buffer
+        # created before any pen stamps, so the tiles stay beneath every sprite
+        self.background = BackgroundRenderer(background.layers)
+        self.pens = {}
+        self.pen_states = {}
+        self.previous = None
+        self.previous_index = {}
+        self.snap_distance = 100
+        self.batch_count = 0
+        self.drawn_count = 0
+        self.culled_count = 0
+        self.shape_extents = {}
+        self.lock = threading.Lock()
+        resource_tracker.set_limit("Pen", self.pen_limit, self.lock)
+
+    def pen_limit(self):
+        # every batch holds a pen and up to a pool's worth wait between frames
+        return pen_pool_limit + self.batch_count
+
+    def lerp(self, a, b, alpha):
+        return a + (b - a) * alpha
+
+    def shape_extent(self, shape):
+        # polygons scale and rotate with the pen, so they are bounded by their farthest point; images do neither
+        extent = self.shape_extents.get(shape)
+        if extent is None:
+            registered = screen._shapes[shape]
+            if registered._type == "image":
+                extent = (False, registered._data.width() / 2, registered._data.height() / 2)
+            elif registered._type == "polygon":
+                radius = max(math.hypot(x, y) for x, y in registered._data)
+                extent = (True, radius, radius)
+            else:
+                extent = None
+            self.shape_extents[shape] = extent
+        return extent
 
-    def pseudostamp(self):
-        super().pseudostamp()
-        self.pen.color(self.color)
-        self.pen.write(self.text, font=(self.font, self.font_size), align=self.align)
+    def in_view(self, shape, x, y, scale_x, scale_y):
+        extent = self.shape_extent(shape)
+        if extent is None:
+            return True
+        scaled, half_width, half_height = extent
+        if scaled:
+            stretch = max(abs(scale_x), abs(scale_y))
+            half_width *= stretch
+            half_height *= stretch
+        return (abs(x) - half_width < game_dimensions.x / 2) and (abs(y) - half_height < game_dimensions.y / 2)
+
+    def pen_state(self, key, pens):
+        pen = self.pens.pop(key, None)
+        if pen is None:
+            pen = acquire_pen()
+        pens[key] = pen
+        state = self.pen_states.get(pen)
+        if state is None:
+            state = PenState(pen)
+            self.pen_states[pen] = state
+        return state
+
+    def render(self):
+        previous, latest = self.snapshot_buffer.read()
+        if latest is None:
+            return
+        if previous is not self.previous:
+            self.previous = previous
+            self.previous_index = {} if previous is None else {render_id: i for i, render_id in enumerate(previous.ids)}
+        previous_index = {} if latest.cut else self.previous_index
+        alpha = min(1, (time.perf_counter() - latest.published_at) / (frame_ms / 1000))
+
+        if previous is None or latest.cut:
+            self.background.render(latest.background_time)
+        else:
+            self.background.render(self.lerp(previous.background_time, latest.background_time, alpha))
+
+        # objects sharing sort order, shape, color and scale are stamped by one pen
+        batches = {}
+        drawn_count = 0
+        culled_count = 0
+        for i in range(0, len(latest.ids)):
+            render_id = latest.ids[i]
+            x = latest.xs[i]
+            y = latest.ys[i]
+            rotation = latest.rotations[i]
+            scale_x = latest.scale_xs[i]
+            scale_y = latest.scale_ys[i]
+            j = previous_index.get(render_id)
+            if j is not None and abs(x - previous.xs[j]) + abs(y - previous.ys[j]) < self.snap_distance:
+                x = self.lerp(previous.xs[j], x, alpha)
+                y = self.lerp(previous.ys[j], y, alpha)
+                rotation = self.lerp(previous.rotations[j], rotation, alpha)
+                scale_x = self.lerp(previous.scale_xs[j], scale_x, alpha)
+                scale_y = self.lerp(previous.scale_ys[j], scale_y, alpha)
+
+            text = latest.texts[i]
+            if latest.cullables[i] and not self.in_view(latest.shapes[i], x, y, scale_x, scale_y):
+                culled_count += 1
+                continue
+            drawn_count += 1
+            if text is None:
+                key = (latest.sort_orders[i], latest.shapes[i], latest.colors[i], scale_x, scale_y)
+            else:
+                key = ("text", render_id)
+            batch = batches.get(key)
+            if batch is None:
+                batch = []
+                batches[key] = batch
+            batch.append((x, y, rotation, latest.colors[i], text))
+
+        pens = {}
+        for key, batch in batches.items():
+            state = self.pen_state(key, pens)
+            pen = state.pen
+            pen.clear()
+            if key[0] == "text":
+                x, y, rotation, color, text = batch[0]
+                state.set_color(color)
+                pen.goto(x, y)
+                pen.write(text[0], font=text[1], align=text[2])
+                continue
+            sort_order, shape, color, scale_x, scale_y = key
+            state.set_shape(shape)
+            state.set_color(color)
+            state.set_stretch((scale_x, scale_y))
+            # a circle stretched evenly looks the same at every heading
+            symmetric = shape == "circle" and scale_x == scale_y
+            for x, y, rotation, color, text in batch:
+                if not symmetric:
+                    state.set_heading(rotation)
+                pen.goto(x, y)
+                pen.stamp()
+
+        for pen in self.pens.values():
+            if not release_pen(pen):
+                del self.pen_states[pen]
+        self.pens = pens
+        self.batch_count = len(batches)
+        self.drawn_count = drawn_count
+        self.culled_count = culled_count
+
+    def loop(self):
+        if simulation.error is not None:
+            screen.bye()
+            return
+        with self.lock:
+            self.render()
+        screen.ontimer(self.loop, frame_ms)
 
 class Input:
     def __init__(self):
         self.keys = ["a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k", "l", "m", "n", "o", "p", "q", "r", "s", "t", "u", "v", "w", "x", "y", "z",
                      "Up", "Down", "Left", "Right",
-                     "space", "Return", "Shift_L",
+                     "space", "Return", "Shift_L", "F5", "F9",
                      "1", "2", "3", "4", "5", "6", "7", "8", "9", "0"]
         self.keys_down = set()
         self.keys_down_this_frame = set()
         self.keys_up_this_frame = set()
+        self.events = queue.Queue()
 
-        screen.listen()
-        for key in self.keys:
-            screen.onkeypress(lambda k = key: self.internal_down(k), key)
-            screen.onkeyrelease(lambda k = key: self.internal_up(k), key)
+        if screen is not None:
+            screen.listen()
+            for key in self.keys:
+                screen.onkeypress(lambda k = key: self.events.put((k, True)), key)
+                screen.onkeyrelease(lambda k = key: self.events.put((k, False)), key)
 
     def update(self):
         self.keys_down_this_frame.clear()
         self.keys_up_this_frame.clear()
+        while True:
+            try:
+                key, down = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if down:
+                self.internal_down(key)
+            else:
+                self.internal_up(key)
 
     def internal_down(self, key):
         self.keys_down.add(key)
@@ -286,8 +892,10 @@ class EdgeConstrict(Component):
     def update(self):
         super().update()
         transform = self.game_object.transform
-        transform.position.x = self.constrict(transform.position.x, game_dimensions.x / 2, transform.scale.x * 10)
-        transform.position.y = self.constrict(transform.position.y, (game_dimensions.y + 10) / 2, transform.scale.y * 20)
+        x = self.constrict(transform.position.x, game_dimensions.x / 2, transform.scale.x * 10)
+        y = self.constrict(transform.position.y, (game_dimensions.y + 10) / 2, transform.scale.y * 20)
+        if x != transform.position.x or y != transform.position.y:
+            transform.position = Vector2(x, y)
 
     def constrict(self, a, b, extra_size = 0):
         if a >= (b - extra_size):
@@ -391,6 +999,7 @@ class Shooter(Component):
             if len(bullets) >= bullet_limit:
                 return
             bul = GameObject()
+            bul.transient = True
             bul.transform.position = self.game_object.transform.position + self.spawn_position
             sprite = bul.add_component(Sprite(self.color, "circle"))
             sprite.sort_order = self.sort_order
@@ -412,7 +1021,7 @@ class Shooter(Component):
                     self.radiance_counter += 1
                     if self.radiance_counter > self.max_radiance_counter:
                         self.radiance_counter = 0
-            bul.transform.scale = self.bullet_scale
+            bul.transform.scale = Vector2(self.bullet_scale.x, self.bullet_scale.y)
             bullet_script = bul.add_component(Bullet(angle = angle, speed = self.bullet_speed))
             bullet_script.rotation_speed = self.bullet_rot
             bullet_script.rot_delay = self.bullet_rot_delay
@@ -444,18 +1053,23 @@ class Entity(Component):
                 transform = self.game_object.transform
                 bullet_transform = bullet.game_object.transform
                 if (transform.position - bullet_transform.position).magnitude() < bullet.radius:
-                    self.take_damage(1)
-
-                    if self.health <= 0:
-                        self.die()
+                    if self.hit(bullet):
                         return
 
-                    damage_particle = GameObject(position=bullet_transform.position).add_component(DamageParticle(self.death_effect_color))
-                    reduced_angle = bullet.angle
-                    if abs(reduced_angle) > 360:
-                        reduced_angle -= 360 * 1 if reduced_angle > 0 else -1
-                    if reduced_angle < 0:
-                        damage_particle.going_up = False
+    def hit(self, bullet):
+        self.take_damage(1)
+
+        if self.health <= 0:
+            self.die()
+            return True
+
+        damage_particle = GameObject(position=bullet.game_object.transform.position).add_component(DamageParticle(self.death_effect_color))
+        reduced_angle = bullet.angle
+        if abs(reduced_angle) > 360:
+            reduced_angle -= 360 * 1 if reduced_angle > 0 else -1
+        if reduced_angle < 0:
+            damage_particle.going_up = False
+        return False
 
     def start(self):
         super().start()
@@ -468,8 +1082,8 @@ class Entity(Component):
     def update(self):
         if (self.active == False) or game_manager.ended:
             return
-        self.game_object.transform.position.x += self.move_input.x * self.move_speed
-        self.game_object.transform.position.y += self.move_input.y * self.move_speed
+        if self.move_input.x != 0 or self.move_input.y != 0:
+            self.game_object.transform.position += self.move_input * self.move_speed
 
 class BlackBars(Component):
     def __init__(self, dimensions):
@@ -481,6 +1095,7 @@ class BlackBars(Component):
             bar = GameObject()
             bar_sprite = bar.add_component(Sprite("black", "square"))
             bar_sprite.sort_order = 99
+            bar_sprite.cullable = False
             bar_width = 40
 
             mult = 1
@@ -496,6 +1111,7 @@ class BlackBars(Component):
 class Lerp:
     def __init__(self, obj, attribute, target, speed, int_only = False):
         lerps.append(self)
+        resource_tracker.allocate(self, "Lerp", transient=True)
         self.timer = 0
         self.lerping = True
         self.target = target
@@ -520,7 +1136,36 @@ class Lerp:
                 self.timer = 0
                 self.lerping = False
                 self.on_complete()
-                lerps.remove(self)
+                self.cancel()
+
+    def cancel(self):
+        if self in lerps:
+            lerps.remove(self)
+            resource_tracker.release(self)
+
+class Timer:
+    def __init__(self, callback, ms, owner = None):
+        timers.append(self)
+        resource_tracker.allocate(self, "Timer", transient=True)
+        self.callback = callback
+        self.frames_left = max(1, int(ms / frame_ms))
+        self.owner = owner
+        if owner is not None:
+            owner.timers.append(self)
+
+    def update(self):
+        self.frames_left -= 1
+        if self.frames_left <= 0:
+            self.cancel()
+            self.callback()
+
+    def cancel(self):
+        if self in timers:
+            timers.remove(self)
+            resource_tracker.release(self)
+        if self.owner is not None:
+            self.owner.timers.remove(self)
+            self.owner = None
 
 class GameManager(Component):
     def __init__(self):
@@ -581,7 +1226,7 @@ class Player(Entity):
         self.sprite.transform.ignore_parent_scale = True
         self.sprite.transform.parent = self.game_object.transform
         self.sprite.transform.scale = Vector2(2, 1)
-        screen.ontimer(self.end_invincibility, 1000)
+        Timer(self.end_invincibility, 1000, owner=self.game_object)
 
         self.wide_shooter = self.game_object.add_component(
             Shooter(speed=30, timer=2, bands=5, spread=25, radius=16, player_flag=True, color="turquoise4"))
@@ -599,7 +1244,7 @@ class Player(Entity):
 
         super().die()
         game_manager.add_score(-100)
-        screen.ontimer(spawn_player, 1000)
+        Timer(spawn_player, 1000)
 
     def update(self):
         if game_manager.ended:
@@ -634,6 +1279,7 @@ class DeathEffect(Component):
         self.color = color
 
     def start(self):
+        self.game_object.transient = True
         sprites = []
         outer_circle = self.game_object.add_component(Sprite(self.color, "circle"))
         outer_circle.sort_order = 5
@@ -644,8 +1290,8 @@ class DeathEffect(Component):
         segment_duration = int(lifetime/blinks)
         for i in range(1, blinks + 1):
             for s in sprites:
-                screen.ontimer(s.toggle_visibility, segment_duration * i)
-        screen.ontimer(self.game_object.destroy, segment_duration * (blinks + 2))
+                Timer(s.toggle_visibility, segment_duration * i, owner=self.game_object)
+        Timer(self.game_object.destroy, segment_duration * (blinks + 2), owner=self.game_object)
 
 class DamageParticle(Component):
     def __init__(self, color):
@@ -657,8 +1303,10 @@ class DamageParticle(Component):
         self.going_up = True
 
     def start(self):
+        self.game_object.transient = True
         for i in range(0, 3):
             graphic_object = GameObject()
+            graphic_object.transient = True
             graphic_object.add_component(Sprite("white", "circle"))
             graphic_object.transform.parent = self.game_object.transform
             graphic_object.transform.local_position = Vector2(0, -10)
@@ -668,47 +1316,66 @@ class DamageParticle(Component):
     def update(self):
         if self.game_object.transform.scale.x > 0.01:
             self.t += 1
-            self.game_object.transform.scale.x -= 0.1
-            self.game_object.transform.scale.y += 0.1
+            self.game_object.transform.scale += Vector2(-0.1, 0.1)
             mult = 1
             if not self.going_up:
                 mult = -1
-            self.game_object.transform.position.y += (self.speed/10) * mult
+            self.game_object.transform.position += Vector2(0, (self.speed/10) * mult)
         else:
             self.game_object.destroy()
+            return
         for i in range(0, len(self.graphic_objects)):
             graphic_object = self.graphic_objects[i]
-            graphic_object.transform.local_position.x = (i-3/2) * self.t * 1
+            graphic_object.transform.local_position = Vector2((i-3/2) * self.t * 1, graphic_object.transform.local_position.y)
+
+class BackgroundLayer:
+    def __init__(self, image, scroll_rate, x = 0):
+        self.image = image
+        self.scroll_rate = scroll_rate
+        self.x = x
 
 class Background(Component):
-    def __init__(self):
+    def __init__(self, layers = None):
         super().__init__()
-        self.slides = []
-        self.scroll_rate = 2
-
-    def start(self):
-        for i in range(0, 2):
-            game_object = GameObject()
-            game_object.transform.position = Vector2(0, i * 900)
-            game_object.transform.parent = self.game_object.transform
-            sprite = game_object.add_component(Sprite("white", "bg.gif"))
-            sprite.sort_order = -99
+        if layers is None:
+            layers = [BackgroundLayer("bg.gif", 125)]
+        self.layers = layers
+        self.scroll_time = 0
 
     def update(self):
         if game_manager.ended:
             return
-        self.game_object.transform.position.y -= self.scroll_rate
-        if abs(self.game_object.transform.position.y) >= 900:
-            self.game_object.transform.position.y = 0
+        self.scroll_time += frame_ms / 1000
 
 class Enemy(Entity):
     def __init__(self, health=25, events=[]):
         super().__init__()
         self.health = health
         self.shooters = []
-        self.events = events
+        self.set_events(events)
+        self.events_take_enemy = False
+        self.event_index = 0
+        self.event_frame = 0
         self.death_effect_scale = Vector2(3, 3)
 
+    def start(self):
+        super().start()
+        enemies.append(self)
+
+    def set_events(self, events):
+        self.events = events
+        self.events_index = len(enemy_events)
+        enemy_events.append(events)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["events"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.events = enemy_events[self.events_index]
+
     def add_shooter(self, shooter):
         self.game_object.add_component(shooter)
         self.shooters.append(shooter)
@@ -723,55 +1390,324 @@ class Enemy(Entity):
         game_manager.add_score(500)
 
     def event_routine(self):
-        for event in self.events:
+        while self.event_index < len(self.events):
+            event = self.events[self.event_index]
             if callable(event):
-                event()
+                if self.events_take_enemy:
+                    event(self)
+                else:
+                    event()
             else:
-               for frame in event:
-                   if self.dead:
-                       return
-                   yield
-
-    def update(self):
-        super().update()
-        self.collide(allow_player_bullets=True)
+                while self.event_frame < event.frames:
+                    if self.dead:
+                        return
+                    self.event_frame += 1
+                    yield
+            self.event_index += 1
+            self.event_frame = 0
 
     def take_damage(self, val):
         super().take_damage(val)
         game_manager.add_score(1)
 
+def find_bullet_hits(targets, player_flag):
+    cell_size = collision_cell_size
+    grid = {}
+    for index in range(0, len(bullets)):
+        bullet = bullets[index]
+        if bullet.player_flag != player_flag:
+            continue
+        if bullet.radius > cell_size:
+            cell_size = bullet.radius
+    for index in range(0, len(bullets)):
+        bullet = bullets[index]
+        if bullet.player_flag != player_flag:
+            continue
+        position = bullet.game_object.transform.position
+        grid.setdefault((int(position.x // cell_size), int(position.y // cell_size)), []).append(index)
+
+    hits = []
+    if not grid:
+        return hits
+    for target in targets:
+        position = target.game_object.transform.position
+        cell_x = int(position.x // cell_size)
+        cell_y = int(position.y // cell_size)
+        candidates = []
+        for x in range(cell_x - 1, cell_x + 2):
+            for y in range(cell_y - 1, cell_y + 2):
+                candidates.extend(grid.get((x, y), ()))
+        candidates.sort()
+        for index in candidates:
+            bullet = bullets[index]
+            bullet_position = bullet.game_object.transform.position
+            dx = position.x - bullet_position.x
+            dy = position.y - bullet_position.y
+            if dx * dx + dy * dy < bullet.radius * bullet.radius:
+                hits.append((target, bullet))
+    return hits
+
+def collide_enemies():
+    targets = [enemy for enemy in enemies if enemy.active]
+    if not targets:
+        return
+    for enemy, bullet in find_bullet_hits(targets, player_flag=True):
+        if not enemy.dead:
+            enemy.hit(bullet)
+
 class EnemySequencer(Component):
     def __init__(self):
         super().__init__()
-        self.enemies = []
+        self.waves = []
+        self.current_wave = 0
+        self.end_delay = wait_for_seconds(2)
+        self.end_frame = 0
 
-    def routine(self):
-        for i in range(0, len(self.enemies)):
-            enemy = self.enemies[i]
+    def add_enemy(self, enemy):
+        self.add_wave([enemy])
+
+    def add_wave(self, wave):
+        self.waves.append(wave)
+
+    def wave_routine(self, wave):
+        for enemy in wave:
             enemy.active = True
-            yield from enemy.event_routine()
-        yield from wait_for_seconds(2)
+        routines = [enemy.event_routine() for enemy in wave]
+        while routines:
+            for routine in routines[:]:
+                try:
+                    next(routine)
+                except StopIteration:
+                    routines.remove(routine)
+            if routines:
+                yield
+
+    def routine(self):
+        while self.current_wave < len(self.waves):
+            resource_tracker.check_stage(self.current_wave)
+            yield from self.wave_routine(self.waves[self.current_wave])
+            # finished waves are dropped so their enemies can be collected
+            self.waves[self.current_wave] = []
+            self.current_wave += 1
+        resource_tracker.check_stage(self.current_wave)
+        while self.end_frame < self.end_delay.frames:
+            self.end_frame += 1
+            yield
         yield game_manager.end_game()
 
+class SnapshotError(RuntimeError):
+    pass
+
+snapshot_magic = b"GALAGA"
+snapshot_version = 2
+snapshot_header = struct.Struct("<6sHI20s")
+
+def events_signature():
+    # enemies find their events by index on restore, so the stage scripts must match the ones that were saved
+    digest = hashlib.sha1()
+    for events in enemy_events:
+        digest.update(b"|")
+        for event in events:
+            if isinstance(event, Wait):
+                digest.update(b"wait" + str(event.frames).encode())
+                continue
+            code = getattr(event, "__code__", None)
+            if code is None:
+                digest.update(getattr(event, "__qualname__", type(event).__name__).encode())
+                continue
+            consts = [const for const in code.co_consts if not hasattr(const, "co_code")]
+            digest.update(code.co_code + repr(code.co_names).encode() + repr(consts).encode())
+    return digest.digest()
+
+def snapshot_world():
+    world = {
+        "globals": {name: value for name, value in globals().items() if isinstance(value, Component)},
+        "game_objects": game_objects,
+        "render_objects": render_objects,
+        "bullets": bullets,
+        "enemies": enemies,
+        "lerps": lerps,
+        "timers": timers,
+        "dirty_transforms": dirty_transforms,
+        # systems update in index order, which swap-removal has shuffled away from game_objects order
+        "component_index": component_index,
+        "coroutines": [coroutine_source(coroutine) for coroutine in coroutines],
+        "random": random.getstate(),
+        "next_render_id": next_render_id,
+        "tick_count": simulation.tick_count,
+    }
+    header = snapshot_header.pack(snapshot_magic, snapshot_version, len(enemy_events), events_signature())
+    return header + pickle.dumps(world, pickle.HIGHEST_PROTOCOL)
+
+def restore_world(data):
+    # snapshots are pickles and run code when loaded: only load files this game wrote
+    global next_render_id
+    if len(data) < snapshot_header.size:
+        raise SnapshotError("not a snapshot: file is too short")
+    magic, version, event_count, signature = snapshot_header.unpack_from(data)
+    if magic != snapshot_magic:
+        raise SnapshotError("not a snapshot: bad header")
+    if version != snapshot_version:
+        raise SnapshotError("snapshot format " + str(version) + " is not supported, expected " + str(snapshot_version))
+    if event_count != len(enemy_events) or signature != events_signature():
+        raise SnapshotError("snapshot was saved with different stage scripts")
+    world = pickle.loads(data[snapshot_header.size:])
+    game_objects[:] = world["game_objects"]
+    render_objects[:] = world["render_objects"]
+    bullets[:] = world["bullets"]
+    enemies[:] = world["enemies"]
+    lerps[:] = world["lerps"]
+    timers[:] = world["timers"]
+    dirty_transforms[:] = world["dirty_transforms"]
+    globals().update(world["globals"])
+    coroutines[:] = [getattr(owner, name)() for owner, name in world["coroutines"]]
+    component_index.clear()
+    component_index.update(world["component_index"])
+    resource_tracker.release_kinds(["GameObject", "Lerp", "Timer", "Coroutine"])
+    resource_tracker.reset_stages()
+    for kind, objects in [("GameObject", game_objects), ("Lerp", lerps), ("Timer", timers), ("Coroutine", coroutines)]:
+        for obj in objects:
+            resource_tracker.allocate(obj, kind, transient=kind in ["Lerp", "Timer"], site="restore_world")
+    random.setstate(world["random"])
+    next_render_id = world["next_render_id"]
+    simulation.tick_count = world["tick_count"]
+    simulation.cut = True
+
+def save_snapshot(path):
+    with open(path, "wb") as f:
+        f.write(snapshot_world())
+
+def load_snapshot(path):
+    with open(path, "rb") as f:
+        restore_world(f.read())
+
+class Simulation:
+    def __init__(self):
+        self.tick_count = 0
+        self.max_lag = 0.25
+        self.running = False
+        self.cut = False
+        self.thread = None
+        self.error = None
+        self.save_at = None
+
+    @property
+    def time(self):
+        return self.tick_count * frame_ms / 1000
+
+    def tick(self):
+        input_manager.update()
+        if input_manager.get_key_down("F5"):
+            save_snapshot(quicksave_path)
+        elif input_manager.get_key_down("F9") and os.path.exists(quicksave_path):
+            try:
+                load_snapshot(quicksave_path)
+            except SnapshotError as error:
+                print("quickload skipped: " + str(error))
+        run_systems()
+        collide_enemies()
+        for lerp in lerps:
+            lerp.update()
+        for timer in timers[:]:
+            timer.update()
+        for coroutine in coroutines[:]:
+            try:
+                next(coroutine)
+            except StopIteration:
+                stop_coroutine(coroutine)
+        resolve_transforms()
+        self.tick_count += 1
+        render_buffer.publish(RenderSnapshot.capture(self.time, self.cut))
+        self.cut = False
+        if self.tick_count == self.save_at:
+            save_snapshot(quicksave_path)
+
+    def run(self):
+        tick_seconds = frame_ms / 1000
+        next_tick = time.perf_counter()
+        try:
+            while self.running:
+                self.tick()
+                next_tick += tick_seconds
+                delay = next_tick - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -self.max_lag:
+                    next_tick = time.perf_counter()
+        except Exception as error:
+            # the renderer closes the window and the main thread raises it after mainloop
+            self.error = error
+            self.running = False
+
+    def run_headless(self, max_ticks):
+        while not game_manager.ended:
+            if self.tick_count >= max_ticks:
+                raise RuntimeError("stages did not finish within " + str(max_ticks) + " ticks")
+            self.tick()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--snapshot", help="start from a world snapshot saved with F5")
+parser.add_argument("--save-snapshot-at", type=int, metavar="TICK", help="save the world to snapshot.bin once this many ticks have run, like pressing F5 at that tick")
+parser.add_argument("--seed", type=int, help="seed the random effects, so --run-stages --save-snapshot-at saves the same world every time")
+parser.add_argument("--debug-resources", action="store_true", help="track engine resources and fail when they grow across a stage")
+parser.add_argument("--run-stages", action="store_true", help="play every stage on the simulation alone, without opening a window or rendering, as fast as possible, then exit")
+parser.add_argument("--profile-systems", action="store_true", help="print the time spent in each component system")
+args = parser.parse_args()
+if args.seed is not None:
+    random.seed(args.seed)
+
+resource_tracker = ResourceTracker(enabled=args.debug_resources)
+
+frame_ms = 16
+profile_systems = args.profile_systems
+system_timings = {}
+component_index = {}
+dirty_transforms = []
+system_order = [GameManager, Background, Player, Enemy, Shooter, Bullet, EdgeDelete, EdgeConstrict, DamageParticle]
+quicksave_path = "snapshot.bin"
 bullet_limit = 1000
+collision_cell_size = 40
 bullets = []
+enemies = []
 render_objects = []
 game_objects = []
 lerps = []
+timers = []
 coroutines = []
+pen_pool = []
+pen_pool_limit = 64
+enemy_events = []
+next_render_id = 0
+render_buffer = SnapshotBuffer()
+simulation = Simulation()
 
-screen = turtle.Screen()
-
-screen.tracer(0, 0)
-screen.delay(0)
-
-screen.title("Galaga")
 screen_dimensions = Vector2(720, 700)
 game_dimensions = Vector2(420, 700)
-black_bars = GameObject().add_component(BlackBars(game_dimensions))
-screen.setup(screen_dimensions.x, screen_dimensions.y)
 
-screen.register_shape("bg.gif")
+# --run-stages never opens a window, so it also runs where there is no display
+screen = None
+if not args.run_stages:
+    screen = turtle.Screen()
+
+    screen.tracer(0, 0)
+    screen.delay(0)
+
+    screen.title("Galaga")
+    screen.setup(screen_dimensions.x, screen_dimensions.y)
+
+    screen.register_shape("bg.gif")
+
+black_bars = GameObject().add_component(BlackBars(game_dimensions))
 
 input_manager = Input()
 background = GameObject().add_component(Background())
@@ -785,13 +1721,24 @@ def spawn_player():
     player_object.transform.scale = Vector2(0.25, 0.25)
     return player_script
 
-def create_enemy(health = 125, events = []):
-    enemy_object = GameObject(position=Vector2(0, 400), starting_comps=[Sprite()])
+def create_enemy(health = 125, events = [], position = None):
+    if position is None:
+        position = Vector2(0, 400)
+    enemy_object = GameObject(position=position, starting_comps=[Sprite()])
     enemy_object.transform.rotation = -180
     enemy = enemy_object.add_component(Enemy(health=health, events=events))
     enemy.active = False
     return enemy
-player = spawn_player()
+
+def create_wave(positions, health = 25, events = []):
+    # every enemy in a wave runs the same events, each called with the enemy it scripts
+    wave = []
+    for position in positions:
+        enemy = create_enemy(health=health, events=events, position=position)
+        enemy.events_take_enemy = True
+        wave.append(enemy)
+    return wave
+spawn_player()
 game_manager = GameObject().add_component(GameManager())
 
 enemy_1 = create_enemy(health=55, events=[
@@ -813,7 +1760,7 @@ enemy_1 = create_enemy(health=55, events=[
     wait_for_seconds(4),
     lambda: enemy_1.game_object.destroy()
 ])
-enemy_sequencer.enemies.append(enemy_1)
+enemy_sequencer.add_enemy(enemy_1)
 
 enemy_2 = create_enemy(health=55, events=[
     lambda: enemy_2.game_object.transform.tween_position(Vector2(0, 325), speed=0.5),
@@ -843,7 +1790,7 @@ enemy_2 = create_enemy(health=55, events=[
     wait_for_seconds(5),
     lambda: enemy_2.game_object.destroy()
 ])
-enemy_sequencer.enemies.append(enemy_2)
+enemy_sequencer.add_enemy(enemy_2)
 
 enemy_3 = create_enemy(health=155, events=[
     lambda: enemy_3.game_object.transform.tween_position(Vector2(0, 325), speed=0.5),
@@ -859,31 +1806,28 @@ enemy_3 = create_enemy(health=155, events=[
     wait_for_seconds(5),
     lambda: enemy_3.game_object.destroy()
 ])
-enemy_sequencer.enemies.append(enemy_3)
+enemy_sequencer.add_enemy(enemy_3)
 
 start_coroutine(enemy_sequencer.routine())
 
-def refresh_screen():
-    ros = render_objects
-    ros.sort(key=lambda r: r.sort_order)
-    for r in ros:
-        r.render()
-
-def game_loop():
-    for game_object in game_objects:
-        game_object.update()
-    for lerp in lerps:
-        lerp.update()
-    for coroutine in coroutines:
-        try:
-            next(coroutine)
-        except StopIteration:
-            coroutines.remove(coroutine)
-    refresh_screen()
-    input_manager.update()
-    screen.ontimer(game_loop, 16)
-
-game_loop()
-
-refresh_screen()
-screen.mainloop()
+if args.snapshot:
+    load_snapshot(args.snapshot)
+simulation.save_at = args.save_snapshot_at
+
+if args.run_stages:
+    simulation.run_headless(max_ticks=60 * 60 * 1000 // frame_ms)
+else:
+    renderer = Renderer(render_buffer)
+    simulation.start()
+    renderer.loop()
+    screen.mainloop()
+    simulation.stop()
+
+if resource_tracker.enabled:
+    print(resource_tracker.report())
+if profile_systems and simulation.tick_count > 0:
+    for system in system_order:
+        if system in system_timings:
+            print(system.__name__ + ": " + str(round(system_timings[system] * 1000 / simulation.tick_count, 3)) + " ms/tick")
+if simulation.error is not None:
+    raise simulation.error
@@ -0,0 +1,350 @@
+"""Offline bullet-pattern analyzer for Shooter presets.
+
+Replays Shooter, Bullet and EdgeDelete from main.py over NumPy arrays, without
+turtle or the engine, and reports the live bullet count over time, its peak and
+a density heatmap of the arena.
+
+    python pattern_analyzer.py enemy_3
+    python pattern_analyzer.py --shooter timer=4,rot=4,reverse=5,speed=8,bands=7 --path 0:0:325:-180
+    python pattern_analyzer.py --shooter 'Shooter(timer=7, bands=5, color="turquoise", scale=Vector2(2,2))'
+"""
+
+import argparse
+import ast
+import math
+
+import numpy as np
+
+game_dimensions = (420, 700)
+# wait_for_seconds counts 16 frames to a second of script time, while the engine ticks every 16 ms of play
+frames_per_second = 16
+frame_ms = 16
+
+class ShooterPattern:
+    # color and player_flag do not change the pattern, they are accepted so Shooter(...) configs paste unchanged
+    def __init__(self, speed=15, timer=5, bands=3, spread=180, rot=0, reverse=0, radiance=0, color="red", radius=8, bullet_rot=0, bullet_rot_delay=0, bullet_acceleration=0, bullet_acceleration_delay=0, scale=(0.75, 1.5), player_flag=False, radiance_y_influence=False):
+        self.bullet_speed = speed
+        self.max_shoot_timer = timer
+        self.shoot_timer = self.max_shoot_timer
+        self.bands = bands
+        self.band_spread = spread
+        self.rot = rot
+        self.current_rot_offset = 0
+        self.max_reverse_time = reverse
+        self.current_reverse_time = 0
+        self.reversing = False
+        self.radiance = radiance
+        self.radiance_counter = 0
+        self.max_radiance_counter = 5
+        self.radiance_y_influence = radiance_y_influence
+        self.radius = radius
+        self.bullet_rot = bullet_rot
+        self.bullet_rot_delay = bullet_rot_delay
+        self.bullet_acceleration = bullet_acceleration
+        self.bullet_acceleration_delay = bullet_acceleration_delay
+        self.bullet_scale = scale
+        self.spawn_offset = (0, 7)
+
+    def update(self, field, x, y, rotation):
+        if self.shoot_timer > self.max_shoot_timer:
+            self.shoot_timer = 0
+            self.shoot(field, x, y, rotation)
+        else:
+            self.shoot_timer += 1
+
+        if self.max_reverse_time > 0:
+            if not self.reversing:
+                self.current_reverse_time += 1
+                self.current_rot_offset += self.rot
+            else:
+                self.current_rot_offset -= self.rot
+                self.current_reverse_time -= 1
+
+            if abs(self.current_reverse_time) > self.max_reverse_time - 1:
+                self.reversing = not self.reversing
+
+    def shoot(self, field, x, y, rotation):
+        for i in range(0, self.bands):
+            angle = rotation + (self.band_spread / (self.bands + 1) * (i+1)) + (180-self.band_spread)/2 + self.current_rot_offset
+
+            if self.radiance > 0:
+                if (abs(angle) - rotation) > 10:
+                    amount = self.radiance
+                    if self.radiance_y_influence:
+                        amount *= ((game_dimensions[1] / 8 - y) - 15) / 1000
+                    if amount < 0:
+                        amount = 0
+                    angle += amount * (self.radiance_counter - (self.max_radiance_counter/2))
+                    self.radiance_counter += 1
+                    if self.radiance_counter > self.max_radiance_counter:
+                        self.radiance_counter = 0
+
+            if not field.spawn(self, x + self.spawn_offset[0], y + self.spawn_offset[1], angle):
+                return
+
+class BulletField:
+    def __init__(self, bullet_limit):
+        self.bullet_limit = bullet_limit
+        self.alive = np.zeros(bullet_limit, dtype=bool)
+        self.x = np.zeros(bullet_limit)
+        self.y = np.zeros(bullet_limit)
+        self.angle = np.zeros(bullet_limit)
+        self.speed = np.zeros(bullet_limit)
+        self.scale_x = np.zeros(bullet_limit)
+        self.scale_y = np.zeros(bullet_limit)
+        self.rotation_speed = np.zeros(bullet_limit)
+        self.extra_rotation = np.zeros(bullet_limit)
+        self.rot_delay = np.zeros(bullet_limit)
+        self.rot_delay_timer = np.zeros(bullet_limit)
+        self.acceleration = np.zeros(bullet_limit)
+        self.extra_speed = np.zeros(bullet_limit)
+        self.acceleration_delay = np.zeros(bullet_limit)
+        self.acceleration_delay_timer = np.zeros(bullet_limit)
+        self.live = 0
+
+    def spawn(self, shooter, x, y, angle):
+        if self.live >= self.bullet_limit:
+            return False
+        slot = int(np.argmin(self.alive))
+        self.alive[slot] = True
+        self.x[slot] = x
+        self.y[slot] = y
+        self.angle[slot] = angle
+        self.speed[slot] = shooter.bullet_speed
+        self.scale_x[slot] = shooter.bullet_scale[0]
+        self.scale_y[slot] = shooter.bullet_scale[1]
+        self.rotation_speed[slot] = shooter.bullet_rot
+        self.extra_rotation[slot] = 0
+        self.rot_delay[slot] = shooter.bullet_rot_delay
+        self.rot_delay_timer[slot] = 0
+        self.acceleration[slot] = shooter.bullet_acceleration
+        self.extra_speed[slot] = 0
+        self.acceleration_delay[slot] = shooter.bullet_acceleration_delay
+        self.acceleration_delay_timer[slot] = 0
+        self.live += 1
+        return True
+
+    def step(self):
+        alive = self.alive
+        self.rot_delay_timer += (self.rot_delay > 0) & alive
+        self.acceleration_delay_timer += (self.acceleration_delay > 0) & alive
+        radians = np.radians(self.angle + self.extra_rotation)
+        velocity = (self.speed + self.extra_speed) * alive
+        self.x += np.cos(radians) * velocity
+        self.y += np.sin(radians) * velocity
+        rotating = alive & ((self.rot_delay <= 0) | (self.rot_delay_timer >= self.rot_delay))
+        self.extra_rotation += self.rotation_speed * rotating
+        accelerating = alive & ((self.acceleration_delay <= 0) | (self.acceleration_delay_timer >= self.acceleration_delay))
+        self.extra_speed += self.acceleration * accelerating
+
+        # same bounds as EdgeDelete.detect, which pads by the bullet's scaled size
+        half_width = game_dimensions[0] / 2
+        half_height = game_dimensions[1] / 2
+        outside = ((self.x >= half_width + self.scale_x * 12.5) | (self.x <= -half_width - self.scale_x * 10)
+                   | (self.y >= half_height + self.scale_y * 12.5) | (self.y <= -half_height - self.scale_y * 10))
+        self.alive &= ~outside
+        self.live = int(self.alive.sum())
+
+class EmitterPath:
+    def __init__(self, keyframes):
+        self.keyframes = sorted(keyframes)
+
+    def at(self, frame):
+        keyframes = self.keyframes
+        if frame <= keyframes[0][0]:
+            return keyframes[0][1:]
+        for i in range(1, len(keyframes)):
+            if frame <= keyframes[i][0]:
+                f0, x0, y0, r0 = keyframes[i - 1]
+                f1, x1, y1, r1 = keyframes[i]
+                t = (frame - f0) / (f1 - f0)
+                return x0 + (x1 - x0) * t, y0 + (y1 - y0) * t, r0 + (r1 - r0) * t
+        return keyframes[-1][1:]
+
+class TweenPath:
+    # replays Transform.tween_position and tween_rotation the way Lerp steps them: the blend factor grows by
+    # speed/100 every frame until it reaches 0.3, so speed=0.5 runs about 60 frames and eases in
+    def __init__(self, start, tweens):
+        self.x, self.y, self.rotation = start
+        self.pending = sorted(tweens, key=lambda tween: tween[0])
+        self.frame = min([0] + [tween[0] for tween in self.pending]) - 1
+        self.lerps = []
+        self.positions = []
+
+    def step(self):
+        # same order as a Simulation tick: shooters read the position, lerps advance, then events start new lerps
+        if self.frame >= 0:
+            self.positions.append((self.x, self.y, self.rotation))
+        for lerp in self.lerps[:]:
+            attribute, target, speed = lerp[:3]
+            lerp[3] += speed / 100
+            timer = lerp[3]
+            if attribute == "position":
+                self.x += (target[0] - self.x) * timer
+                self.y += (target[1] - self.y) * timer
+            else:
+                self.rotation += (target - self.rotation) * timer
+            if timer >= 0.3:
+                self.lerps.remove(lerp)
+        while self.pending and self.pending[0][0] <= self.frame + 1:
+            frame, attribute, target, speed = self.pending.pop(0)
+            self.lerps.append([attribute, target, speed, 0])
+        self.frame += 1
+
+    def at(self, frame):
+        while len(self.positions) <= frame:
+            self.step()
+        return self.positions[frame]
+
+def seconds(t):
+    return int(t * frames_per_second)
+
+def boss_path(entry, tweens):
+    # bosses spawn at (0, 400) facing down and tween to (0, 325) the given time before their shooters are added
+    return TweenPath((0, 400, -180), [(-seconds(entry), "position", (0, 325), 0.5)] + tweens)
+
+def moves(start, interval, targets):
+    tweens = []
+    for i, (x, y, rotation) in enumerate(targets):
+        frame = seconds(start + interval * i)
+        tweens.append((frame, "position", (x, y), 0.5))
+        if rotation is not None:
+            tweens.append((frame, "rotation", rotation, 0.5))
+    return tweens
+
+# the firing phase of each boss in main.py, measured from the moment its shooters are added
+presets = {
+    "enemy_1": (
+        [dict(timer=4, rot=4, reverse=5, speed=8, bands=7, spread=180)],
+        boss_path(2, moves(5, 5, [(-100, 325, None), (0, 325, None), (100, 325, None), (0, 325, None)])),
+        seconds(25)),
+    "enemy_2": (
+        [dict(timer=4.5, rot=0.5, reverse=10, speed=8, bands=7, spread=160),
+         dict(timer=6.5, rot=5, reverse=5, speed=8, bands=5, bullet_rot=0.5, spread=160)],
+        boss_path(4, moves(5, 5, [(125, 325, -205), (0, 325, -180), (-125, 325, -155), (0, 325, -180),
+                                          (125, 325, -205), (0, 325, -180), (0, 425, None)])),
+        seconds(40)),
+    "enemy_3": (
+        [dict(timer=7, rot=1, reverse=5, speed=7, bands=5, bullet_rot=-0.5, bullet_acceleration=0.1, bullet_acceleration_delay=20, scale=(2, 2), radius=18),
+         dict(timer=7, rot=1, reverse=5, speed=7, bands=5, bullet_rot=0.25, bullet_acceleration=0.1, bullet_acceleration_delay=20, scale=(2, 2), radius=18),
+         dict(timer=18, rot=5, reverse=3, speed=9, bands=3, bullet_rot=1, bullet_rot_delay=10, scale=(4, 4), radius=36)],
+        boss_path(4, []),
+        seconds(52)),
+}
+
+def analyze(shooters, path, frames, bullet_limit=1000, cell_size=20):
+    field = BulletField(bullet_limit)
+    counts = np.zeros(frames, dtype=int)
+    columns = int(math.ceil(game_dimensions[0] / cell_size))
+    rows = int(math.ceil(game_dimensions[1] / cell_size))
+    heatmap = np.zeros((rows, columns))
+    extent = [[-game_dimensions[1] / 2, game_dimensions[1] / 2], [-game_dimensions[0] / 2, game_dimensions[0] / 2]]
+    for frame in range(0, frames):
+        x, y, rotation = path.at(frame)
+        for shooter in shooters:
+            shooter.update(field, x, y, rotation)
+        field.step()
+        counts[frame] = field.live
+        alive = field.alive
+        heatmap += np.histogram2d(field.y[alive], field.x[alive], bins=(rows, columns), range=extent)[0]
+    return counts, heatmap[::-1] / frames
+
+def parse_value(node):
+    if isinstance(node, ast.Call) and getattr(node.func, "id", None) == "Vector2":
+        return tuple(parse_value(arg) for arg in node.args)
+    if isinstance(node, ast.Name):
+        return node.id
+    return ast.literal_eval(node)
+
+def parse_shooter(text):
+    # takes key=value pairs or a Shooter(...) call copied from main.py
+    text = text.strip()
+    if not text.startswith("Shooter("):
+        text = "Shooter(" + text + ")"
+    call = ast.parse(text, mode="eval").body
+    if not isinstance(call, ast.Call) or call.args:
+        raise ValueError("expected key=value pairs")
+    config = {}
+    for keyword in call.keywords:
+        config[keyword.arg] = parse_value(keyword.value)
+    return config
+
+def parse_path(text):
+    keyframes = []
+    for keyframe in text.split(","):
+        values = keyframe.split(":")
+        if len(values) != 4:
+            raise ValueError("keyframe " + repr(keyframe) + " is not frame:x:y:rotation")
+        frame, x, y, rotation = values
+        keyframes.append((int(frame), float(x), float(y), float(rotation)))
+    if len(set(keyframe[0] for keyframe in keyframes)) != len(keyframes):
+        raise ValueError("keyframes must have different frames")
+    return keyframes
+
+def print_heatmap(heatmap):
+    shades = " .:-=+*#%@"
+    peak = heatmap.max()
+    for row in heatmap:
+        if peak == 0:
+            print(" " * len(row))
+            continue
+        print("".join(shades[min(len(shades) - 1, int(value / peak * len(shades)))] for value in row))
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate Shooter bullet patterns without the engine.")
+    parser.add_argument("preset", nargs="?", choices=sorted(presets), help="stage preset from main.py")
+    parser.add_argument("--shooter", action="append", default=[], help="Shooter arguments as key=value pairs, or a Shooter(...) call from main.py")
+    parser.add_argument("--path", help="emitter keyframes as frame:x:y:rotation, comma separated")
+    parser.add_argument("--frames", type=int, help="frames to simulate (16 per second of wait_for_seconds, one per 16 ms tick)")
+    parser.add_argument("--bullet-limit", type=int, default=1000)
+    parser.add_argument("--budget", type=int, help="report frames whose live bullet count exceeds this")
+    parser.add_argument("--cell", type=int, default=20, help="heatmap cell size")
+    parser.add_argument("--counts", help="write the live count per frame to this CSV file")
+    parser.add_argument("--heatmap", help="write the density heatmap to this .npy file")
+    args = parser.parse_args()
+
+    configs, path, frames = [], EmitterPath([(0, 0, 325, -180)]), 52 * frames_per_second
+    if args.preset:
+        configs, path, frames = presets[args.preset]
+    for text in args.shooter:
+        try:
+            configs = configs + [parse_shooter(text)]
+        except (SyntaxError, ValueError) as error:
+            parser.error("bad --shooter " + repr(text) + ": " + str(error))
+    if not configs:
+        parser.error("give a preset or at least one --shooter")
+    if args.path:
+        try:
+            path = EmitterPath(parse_path(args.path))
+        except ValueError as error:
+            parser.error("bad --path: " + str(error))
+    if args.frames is not None:
+        frames = args.frames
+    if frames <= 0 or args.cell <= 0 or args.bullet_limit <= 0:
+        parser.error("--frames, --cell and --bullet-limit must be positive")
+
+    try:
+        shooters = [ShooterPattern(**config) for config in configs]
+    except TypeError as error:
+        parser.error("bad --shooter: " + str(error))
+    counts, heatmap = analyze(shooters, path, frames, args.bullet_limit, args.cell)
+
+    peak_frame = int(counts.argmax())
+    print("frames: " + str(frames))
+    print("peak bullets: " + str(counts[peak_frame]) + " at frame " + str(peak_frame) + " (" + str(round(peak_frame / frames_per_second, 2)) + "s of script time, "
+          + str(round(peak_frame * frame_ms / 1000, 2)) + "s of play)")
+    print("mean bullets: " + str(round(float(counts.mean()), 1)))
+    if args.budget is not None:
+        print("frames over budget: " + str(int((counts > args.budget).sum())))
+    if counts.max() >= args.bullet_limit:
+        print("bullet limit reached, the pattern is being clipped")
+    print("mean bullets per " + str(args.cell) + "px cell:")
+    print_heatmap(heatmap)
+
+    if args.counts:
+        np.savetxt(args.counts, counts, fmt="%d", delimiter=",")
+    if args.heatmap:
+        np.save(args.heatmap, heatmap)
+
+if __name__ == "__main__":
+    main()